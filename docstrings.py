@@ -1,13 +1,26 @@
 from ollama import OllamaService
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
 import libcst as cst
 import queries
-import re
 import textwrap
+import threading
+
+
+# The nodes whose children can contain function or class definitions
+_STATEMENT_CONTAINERS = (cst.Module, cst.BaseCompoundStatement, cst.IndentedBlock, cst.Else,
+                         cst.ExceptHandler, cst.ExceptStarHandler, cst.Finally, cst.MatchCase)
 
 
 class DocstringService:
+    # The number of functions whose model queries may be in flight at the same time, across all files, unless the
+    # options give a --parallel setting
+    MAX_CONCURRENCY = 4
+
     class DocstringUpdater(cst.CSTTransformer):
-        def __init__(self, docstring_service, qualified_function_names):
+        def __init__(self, docstring_service, qualified_function_names, results=None):
             """
             Initializes the object's state and prepares it for use.
 
@@ -22,6 +35,9 @@ class DocstringService:
             qualified_function_names (list): A list of mostly-qualified function names,
                         which represent the complete nesting of functions excluding the
                         module name.
+            results (list): The model results for the functions collected by an earlier
+                        planning pass, in the order they were collected. Defaults to None,
+                        which makes this a planning pass that only collects the functions.
 
             Returns:
             void: Does not return any value. This method's primary effect is initializing
@@ -44,14 +60,24 @@ class DocstringService:
             self.docstring_service = docstring_service
             # options contains the parsed command-line arguments
             self.options = docstring_service.options
-            self.reports = []
+            # Reports are either plain strings or (name, validated, assessment) tuples for validation
+            # results; the tuples are only rendered into text by finalize_reports.
+            self.reports = collections.deque()
             # qualified_function_names is a list of mostly-qualified function names. These are dot-separated
             # identifiers that indicate the complete nesting of the function excluding the module name,
-            # eg class_name.method_name.nested_function_name.
+            # eg class_name.method_name.nested_function_name. Any collection supporting 'in' works; document_file
+            # passes a frozenset so that each function's membership test is a single hash lookup.
             self.qualified_function_names = qualified_function_names
             self.logger = docstring_service.logger
             self.leading_whitespace = []
+            # Replaced by the indentation that the module itself uses by default when it is visited
+            self.default_indent = '    '
             self.modified = False
+            # The planning pass collects (fqfn, name, code, docstring, has simple docstring) for each function to
+            # process, and the second pass applies the model results for them in the same order
+            self.planning = results is None
+            self.pending = []
+            self.results = collections.deque(results or ())
 
         def convert_functiondef_to_string(self, function_def, remove_docstring=False):
             """
@@ -104,9 +130,9 @@ class DocstringService:
             """
             Adds the leading whitespace from a given AST node to a list for later use.
 
-            This function takes an abstract syntax tree (AST) node as input, extracts the
-            leading whitespace from its code string, and appends it to a list. This can be
-            used in further processing or analysis of the source code.
+            This function takes an abstract syntax tree (AST) node as input, reads the
+            indentation of its body, and appends it to a list. This can be used in further
+            processing or analysis of the source code.
 
             Parameters:
             self (object): The object instance that this method belongs to.
@@ -122,15 +148,16 @@ class DocstringService:
              'self.leading_whitespace' list.   add_leading_whitespace(self, node)
 
             Notes:
-            This function appears to be inefficient in its current implementation.
+            The indentation is read from the parsed block rather than from rendered code. A
+             block without its own indentation uses the module's default indentation, as
+             does a single-line body, which becomes an indented block when a docstring is
+             added to it.
             """
-            # This is outrageously ineffient, but I haven't found a better way (yet)
-            code = cst.Module([])
-            code.body.append(node.body)
-            match = re.match(r'\s*', code.code)
-            lws = match.group(0) if match else ''
-            lws = lws.split('\n')[-1]
-            self.leading_whitespace.append(lws)
+            body = node.body
+            if isinstance(body, cst.IndentedBlock) and body.indent is not None:
+                self.leading_whitespace.append(body.indent)
+            else:
+                self.leading_whitespace.append(self.default_indent)
 
         def get_leading_whitespace(self):
             """
@@ -192,6 +219,46 @@ class DocstringService:
             # NOTE: This does not include the module name in the result.
             return '.'.join(self.fully_qualified_function_name)
 
+        def on_visit(self, node):
+            """
+            Decides whether the children of a node need to be visited.
+
+            Functions and classes can only be nested in the bodies of statements, so only
+            the nodes that hold statement bodies are descended into. Expressions,
+            whitespace, and simple statements, which make up most of a module, are skipped
+            in a single step instead of being walked node by node.
+
+            Parameters:
+            self (object): The instance of the class containing this method.
+            node (libcst.CSTNode): The node being visited.
+
+            Returns:
+            boolean: True if the node's children should be visited, otherwise False.
+
+            Examples:
+            Called by libcst for every node reached during a visit.   tree.visit(self)
+            """
+            if not isinstance(node, _STATEMENT_CONTAINERS):
+                return False
+            return super().on_visit(node)
+
+        def visit_Module(self, node):
+            """
+            Records the default indentation of the module being visited.
+
+            Parameters:
+            self (object): The instance of the class containing this method.
+            node (libcst.Module): The module being visited.
+
+            Returns:
+            boolean: True, so that the module's children are visited.
+
+            Examples:
+            Called by libcst when a visit of a module begins.   tree.visit(self)
+            """
+            self.default_indent = node.default_indent
+            return True
+
         def visit_ClassDef(self, node):
             """
             Visits a ClassDef node in an Abstract Syntax Tree (AST) and updates the current
@@ -227,7 +294,8 @@ class DocstringService:
             self.class_level += 1
             self.fully_qualified_function_name.append(node.name.value)
             self.add_leading_whitespace(node)
-            self.logger.info(f"Examining class: {self.get_fully_qualified_function_name()}")
+            if not self.planning:
+                self.logger.info(f"Examining class: {self.get_fully_qualified_function_name()}")
 
         def leave_ClassDef(self, original_node, updated_node):
             """
@@ -294,7 +362,8 @@ class DocstringService:
             self.function_level += 1
             self.fully_qualified_function_name.append(node.name.value)
             self.add_leading_whitespace(node)
-            self.logger.info(f"Examining function: {self.get_fully_qualified_function_name()}")
+            if not self.planning:
+                self.logger.info(f"Examining function: {self.get_fully_qualified_function_name()}")
 
         def format_docstring(self, docstring):
             """
@@ -332,25 +401,26 @@ class DocstringService:
                 formatted_lines.append('\n'.join(wrapped_lines))
             return '"""\n' + '\n'.join(formatted_lines) + '\n' + leading_whitespace + '"""'
     
-        def update_docstring(self, fully_qualified_function_name, function_name, current_docstring, updated_node, action_taken):
+        def update_docstring(self, fully_qualified_function_name, updated_node, action_taken, validation, new_docstring):
             """
             Updates the docstring of a specified function in a code file.
 
-            This function updates the docstring of a specified function by parsing the code,
-            validating the existing docstring if requested, and then updating or stripping
-            the docstring based on options provided. It returns the updated node and an
-            action taken string indicating the outcome.
+            This function records the validation result for the existing docstring, if
+            there is one, and then updates or strips the docstring based on the options
+            provided. It returns the updated node and an action taken string indicating
+            the outcome.
 
             Parameters:
             self (object): The object instance of the class containing this method.
             fully_qualified_function_name (string): The fully qualified name of the function
                         whose docstring is to be updated.
-            function_name (string): The name of the function whose docstring is to be
-                        updated.
-            current_docstring (string): The current docstring of the function.
             updated_node (object): The updated node representing the function's AST.
             action_taken (string): A string indicating the action taken by this method, such
                         as 'updated existing docstring' or 'stripped existing docstring'.
+            validation (tuple): The (validated, assessment) result of validating the
+                        existing docstring, or None if it was not validated.
+            new_docstring (string): The replacement docstring generated by the model, or
+                        None if none was generated.
 
             Returns:
             tuple: Returns a tuple containing the updated node and an action taken string.
@@ -362,69 +432,67 @@ class DocstringService:
 
             Examples:
             Updates the docstring of a function in a code file.   update_docstring(self,
-             'example.module.example_function', 'example_function', current_docstring,
-             updated_node, action_taken)
+             'example.module.example_function', updated_node, action_taken, validation,
+             new_docstring)
 
             Notes:
             This method relies on various libraries and services to parse and generate code.
              Ensure these are installed and the input parameters are valid for proper
              operation.
             """
-            function_code = self.convert_functiondef_to_string(updated_node)
             do_update = self.options.update
             strip_docstring = self.options.strip
-            if self.options.validate:
-                self.logger.debug('Validating existing docstring')
-                validated, assessment = queries.validate_docstring(self.docstring_service.ollama, function_name, function_code, f'"""{current_docstring}"""', self.options, self.logger)
+            if validation is not None:
+                validated, assessment = validation
                 if validated:
                     do_update = False
                     strip_docstring = False
-                report = '-' * 70 + f'\nValidation report for {fully_qualified_function_name}: {"PASS" if validated else "FAILED"}\n{assessment}'
-                self.reports.append(report)
+                self.reports.append((fully_qualified_function_name, validated, assessment))
 
-            body_statements = list(updated_node.body.body)
+            # The block is changed with with_changes rather than rebuilt, so that the comment on the def line and the
+            # block's indentation survive, and functions whose docstring is kept are left untouched
+            body = updated_node.body
+            body_statements = body.body
             if body_statements and isinstance(body_statements[0], cst.SimpleStatementLine) and isinstance(body_statements[0].body[0], cst.Expr):
                 if isinstance(body_statements[0].body[0].value, cst.SimpleString):
                     if strip_docstring:
                         self.logger.debug('Stripping existing docstring')
-                        body_statements.pop(0)  # Remove the first statement assuming it's the docstring
+                        # Remove the first statement assuming it's the docstring. A function with nothing else in its
+                        # body is left with 'pass' so that it remains valid code.
+                        remaining_statements = body_statements[1:] or (cst.SimpleStatementLine([cst.Pass()]),)
+                        updated_node = updated_node.with_changes(body=body.with_changes(body=remaining_statements))
                         action_taken = "stripped existing docstring"
                         self.modified = True
+                    elif do_update and new_docstring is None:
+                        action_taken = "failed to update docstring, leaving as-is"
                     elif do_update:
                         self.logger.debug('Replacing existing docstring')
-                        new_docstring = queries.generate_docstring(self.docstring_service.ollama, fully_qualified_function_name, function_name, function_code, current_docstring, self.options, self.logger)
                         new_docstring = self.format_docstring(new_docstring)
-                        body_statements[0] = cst.SimpleStatementLine([cst.Expr(cst.SimpleString(new_docstring))])
+                        # Only the string is replaced, keeping any comments around the docstring's line
+                        docstring_line = body_statements[0].with_changes(body=[cst.Expr(cst.SimpleString(new_docstring))])
+                        updated_node = updated_node.with_changes(body=body.with_changes(body=(docstring_line, *body_statements[1:])))
                         action_taken = "updated existing docstring"
                         self.modified = True
 
-            updated_body = cst.IndentedBlock(body=body_statements)
-            updated_node = updated_node.with_changes(body=updated_body)
             return updated_node, action_taken
         
-        def create_docstring(self, fully_qualified_function_name, function_name, current_docstring, updated_node, action_taken):
+        def create_docstring(self, updated_node, action_taken, new_docstring):
             """
             Creates a new docstring for a given function and updates its source code.
 
-            This function appends a new docstring to an existing function's source code,
-            using information from the `fully_qualified_function_name`, `function_name`,
-            `current_docstring`, and `updated_node` parameters. If the option to create a
-            new docstring is enabled, it generates and formats the new docstring before
-            updating the function's body.
+            This function inserts a docstring generated by the model at the start of a
+            function's body. If the option to create a new docstring is enabled, it formats
+            the new docstring before updating the function's body.
 
             Parameters:
             self (object): The object instance of this class.
-            fully_qualified_function_name (string): The fully qualified name of the function
-                        for which to create a new docstring.
-            function_name (string): The name of the function for which to create a new
-                        docstring.
-            current_docstring (string): The current docstring of the function, used as a
-                        starting point for generating the new docstring.
             updated_node (object): The updated node representing the function's source code
                         after modifications.
             action_taken (string): A string indicating what action was taken by this
                         function (e.g., 'created a new docstring' or 'failed to create new
                         docstring, leaving as-is').
+            new_docstring (string): The docstring generated by the model, or None if the
+                        model did not produce a valid one.
 
             Returns:
             tuple: Returns a tuple containing the updated node and an action taken string.
@@ -434,10 +502,8 @@ class DocstringService:
                        create a new docstring.
 
             Examples:
-            Creates a new docstring for the function 'my_function' with fully qualified name
-             'package.module.my_function'.   create_docstring(self,
-             'package.module.my_function', 'my_function', current_docstring, updated_node,
-             action_taken)
+            Creates a new docstring for the function 'my_function'.
+             create_docstring(self, updated_node, action_taken, new_docstring)
 
             Notes:
             This function relies on other class instances and services to generate and
@@ -446,13 +512,17 @@ class DocstringService:
             """
             if self.options.create:
                 # Append new docstring
-                self.logger.debug('Creating a new docstring')
-                function_code = self.convert_functiondef_to_string(updated_node)
-                new_docstring = queries.generate_docstring(self.docstring_service.ollama, fully_qualified_function_name, function_name, function_code, current_docstring, self.options, self.logger)
                 if new_docstring is not None:
                     new_docstring = self.format_docstring(new_docstring)
-                    body_statements = [cst.SimpleStatementLine([cst.Expr(cst.SimpleString(new_docstring))])] + list(updated_node.body.body)
-                    updated_body = cst.IndentedBlock(body=body_statements)
+                    docstring_line = cst.SimpleStatementLine([cst.Expr(cst.SimpleString(new_docstring))])
+                    body = updated_node.body
+                    if isinstance(body, cst.IndentedBlock):
+                        # The block keeps the comment on the def line and its indentation
+                        updated_body = body.with_changes(body=(docstring_line, *body.body))
+                    else:
+                        # A one-line body such as 'def f(x): return x' is moved onto its own line below the docstring
+                        updated_body = cst.IndentedBlock(body=(docstring_line, cst.SimpleStatementLine(body.body)),
+                                                         header=body.trailing_whitespace)
                     updated_node = updated_node.with_changes(body=updated_body)
                     action_taken = "created a new docstring"
                     self.modified = True
@@ -466,10 +536,10 @@ class DocstringService:
             of Python source code.
 
             This function determines whether to process or skip the given FunctionDef node
-            based on its nesting level and the qualified function names list. If the node is
-            processed, it updates the docstring if necessary and removes leading whitespace
-            from the node's body. Finally, it logs a report of the action taken and returns
-            the updated node.
+            based on its nesting level and the qualified function names list. During the
+            planning pass, a processed node is only recorded for querying the model.
+            Otherwise it updates the docstring from the model results if necessary. Finally,
+            it logs a report of the action taken and returns the updated node.
 
             Parameters:
             self (object): The instance of the class containing this method.
@@ -500,7 +570,8 @@ class DocstringService:
                 action_taken = f'skipped due to high nesting level -- function_level: {self.function_level}, class_level: {self.class_level}'
                 if self.qualified_function_names is not None and fully_qualified_function_name in self.qualified_function_names:
                     action_taken = f'ignored: you specified {fully_qualified_function_name} to be processed, but the depth setting is too low ({self.options.depth}). Increase the depth with the "--depth {max(self.function_level, self.class_level)}" option.'
-                    self.logging.warning(action_taken)
+                    if not self.planning:
+                        self.logger.warning(action_taken)
             else:
                 do_process = True
                 if self.qualified_function_names is not None:
@@ -509,20 +580,52 @@ class DocstringService:
                         action_taken = f'Skipped because it is not in the decorated filename list of functions to document.'
                 if do_process:
                     current_docstring = updated_node.get_docstring()
-                    if current_docstring is None:
-                        updated_node, action_taken = self.create_docstring(fully_qualified_function_name, function_name, current_docstring, updated_node, action_taken)
+                    if self.planning:
+                        body_statements = updated_node.body.body
+                        has_simple_docstring = (bool(body_statements) and isinstance(body_statements[0], cst.SimpleStatementLine)
+                                                and isinstance(body_statements[0].body[0], cst.Expr)
+                                                and isinstance(body_statements[0].body[0].value, cst.SimpleString))
+                        self.pending.append((fully_qualified_function_name, function_name, self.convert_functiondef_to_string(updated_node),
+                                             current_docstring, has_simple_docstring))
                     else:
-                        updated_node, action_taken = self.update_docstring(fully_qualified_function_name, function_name, current_docstring, updated_node, action_taken)
+                        validation, new_docstring = self.results.popleft()
+                        if current_docstring is None:
+                            updated_node, action_taken = self.create_docstring(updated_node, action_taken, new_docstring)
+                        else:
+                            updated_node, action_taken = self.update_docstring(fully_qualified_function_name, updated_node, action_taken, validation, new_docstring)
             self.remove_leading_whitespace()
 
 
             self.function_level -= 1
-            report = f"{fully_qualified_function_name}: {action_taken}"
-            self.logger.info(report)
-            self.reports.append(report)
+            if not self.planning:
+                report = f"{fully_qualified_function_name}: {action_taken}"
+                self.logger.info(report)
+                self.reports.append(report)
             self.fully_qualified_function_name.pop()
             return updated_node
 
+        def finalize_reports(self):
+            """
+            Renders the collected reports into a list of strings.
+
+            Validation results are stored as tuples while the tree is being walked. This
+            method formats them into their report banners in a single pass, preserving the
+            order in which all reports were recorded.
+
+            Parameters:
+            self (object): The object instance of the class containing this method.
+
+            Returns:
+            list: The list of report strings.
+
+            Examples:
+            Collects the reports after visiting a module.   reports =
+             transformer.finalize_reports()
+            """
+            return [report if isinstance(report, str) else
+                    '-' * 70 + f'\nValidation report for {report[0]}: {"PASS" if report[1] else "FAILED"}\n{report[2]}'
+                    for report in self.reports]
+
     def __init__(self, options, logger):
         """
         Initializes an instance of the class with given options and logger.
@@ -547,6 +650,131 @@ class DocstringService:
         self.logger = logger
         self.ollama = OllamaService()
         self.options = options
+        # Futures for the query results of each distinct function seen in this run, keyed by a digest of its code
+        # and docstring, so that identical functions are only sent to the model once
+        self._query_results = {}
+        self._query_results_lock = threading.Lock()
+        # Files are documented on several threads, each with its own event loop, so the limit on queries in flight is
+        # a thread semaphore shared by all of them rather than one per file
+        self._query_slots = threading.BoundedSemaphore(getattr(options, 'parallel', None) or self.MAX_CONCURRENCY)
+
+    def query_function(self, fully_qualified_function_name, function_name, function_code, current_docstring, has_simple_docstring):
+        """
+        Runs the model queries needed to document a single function.
+
+        Depending on the options, this validates the function's existing docstring and
+        generates a new docstring for it. It can be called for several functions at the
+        same time, but at most options.parallel (or MAX_CONCURRENCY) of them query the
+        model at once, across all files. Functions with the same code and docstring share one set of queries,
+        so a function identical to one seen earlier in the run reuses its results, or
+        waits for them if they are still in flight.
+
+        Parameters:
+        self (object): The current instance of the class.
+        fully_qualified_function_name (string): The fully qualified name of the function.
+        function_name (string): The name of the function.
+        function_code (string): The source code of the function.
+        current_docstring (string): The current docstring of the function, or None if it
+                    has none.
+        has_simple_docstring (boolean): Whether the docstring is a plain string literal
+                    that can be replaced.
+
+        Returns:
+        tuple: The (validated, assessment) validation result, or None if the docstring
+               was not validated, and the generated docstring, or None if none was
+               generated.
+
+        Examples:
+        Validates and regenerates the docstring of 'MyClass.my_function'.
+         query_function('MyClass.my_function', 'my_function', code, docstring, True)
+        """
+        # The queries only depend on the function's code and docstring, not on its name
+        key_data = f'{has_simple_docstring}\0{current_docstring}\0{function_code}'
+        key = hashlib.blake2b(key_data.encode('utf-8'), digest_size=16).digest()
+        with self._query_results_lock:
+            future = self._query_results.get(key)
+            is_first = future is None
+            if is_first:
+                future = self._query_results[key] = concurrent.futures.Future()
+        if not is_first:
+            return future.result()
+
+        try:
+            with self._query_slots:
+                result = self._run_queries(fully_qualified_function_name, function_name, function_code, current_docstring, has_simple_docstring)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    def _run_queries(self, fully_qualified_function_name, function_name, function_code, current_docstring, has_simple_docstring):
+        """
+        Sends the model queries that the options call for to document one function.
+
+        A function without a docstring gets a new one if -c is given. An existing
+        docstring is validated if -v is given, and regenerated if -u is given, unless
+        validation found it correct, it cannot be replaced, or -s is given. This does the work for
+        query_function, which makes sure identical functions are only queried once.
+
+        Parameters:
+        self (object): The current instance of the class.
+        fully_qualified_function_name (string): The fully qualified name of the function.
+        function_name (string): The name of the function.
+        function_code (string): The source code of the function.
+        current_docstring (string): The current docstring of the function, or None if it
+                    has none.
+        has_simple_docstring (boolean): Whether the docstring is a plain string literal
+                    that can be replaced.
+
+        Returns:
+        tuple: The (validated, assessment) validation result, or None if the docstring
+               was not validated, and the generated docstring, or None if none was
+               generated.
+
+        Examples:
+        Creates a docstring for 'MyClass.my_function', which has none.
+         _run_queries('MyClass.my_function', 'my_function', code, None, False)
+        """
+        validation = None
+        new_docstring = None
+        if current_docstring is None:
+            if self.options.create:
+                self.logger.debug('Creating a new docstring')
+                new_docstring = queries.generate_docstring(self.ollama, fully_qualified_function_name, function_name, function_code, current_docstring, self.options, self.logger)
+        else:
+            do_update = self.options.update
+            if self.options.validate:
+                self.logger.debug('Validating existing docstring')
+                validation = queries.validate_docstring(self.ollama, function_name, function_code, f'"""{current_docstring}"""', self.options, self.logger)
+                do_update = do_update and not validation[0]
+            if do_update and has_simple_docstring and not self.options.strip:
+                new_docstring = queries.generate_docstring(self.ollama, fully_qualified_function_name, function_name, function_code, current_docstring, self.options, self.logger)
+        return validation, new_docstring
+
+    async def query_functions(self, pending):
+        """
+        Runs the model queries for several functions concurrently.
+
+        Each function's queries run on the Ollama service's thread pool. query_function
+        allows at most options.parallel (or MAX_CONCURRENCY) functions to be queried at
+        a time across every file being documented, so that the server can work on
+        several requests together without being flooded.
+
+        Parameters:
+        self (object): The current instance of the class.
+        pending (list): The argument tuples for query_function, one per function.
+
+        Returns:
+        list: The results of query_function, in the same order as pending.
+
+        Examples:
+        Queries the model for the functions collected from a module.
+         asyncio.run(self.query_functions(planner.pending))
+        """
+        loop = asyncio.get_running_loop()
+        executor = OllamaService.get_executor()
+        return await asyncio.gather(*[loop.run_in_executor(executor, self.query_function, *job) for job in pending])
 
     def document_file(self, file_path, qualified_function_names):
         """
@@ -554,7 +782,10 @@ class DocstringService:
 
         This function reads a Python file, parses its abstract syntax tree (AST), and
         updates the docstrings of the specified functions using a custom transformer.
-        The transformed AST is then returned along with any reports or modified code.
+        A first pass over the tree collects the functions to process, so that the model
+        can be queried for all of them concurrently, and a second pass applies the
+        results. The transformed AST is then returned along with any reports or
+        modified code.
 
         Parameters:
         file_path (string): The path to the Python file containing the functions whose
@@ -587,7 +818,20 @@ class DocstringService:
         with open(file_path, "r") as source_file:
             source_code = source_file.read()
 
+        # A file without a single 'def' has no functions to document, so it is not worth parsing
+        if 'def' not in source_code:
+            return source_code, [], False
+
         tree = cst.parse_module(source_code)
-        transformer = DocstringService.DocstringUpdater(self, qualified_function_names)
+        if qualified_function_names is not None:
+            qualified_function_names = frozenset(qualified_function_names)
+        planner = DocstringService.DocstringUpdater(self, qualified_function_names)
+        tree.visit(planner)
+        results = asyncio.run(self.query_functions(planner.pending)) if planner.pending else []
+
+        transformer = DocstringService.DocstringUpdater(self, qualified_function_names, results)
         modified_tree = tree.visit(transformer)
-        return modified_tree.code, transformer.reports, transformer.modified
+        modified_code = modified_tree.code
+        # A regenerated docstring can come out identical to the one it replaces, which leaves nothing to save
+        modified = transformer.modified and modified_code != source_code
+        return modified_code, transformer.finalize_reports(), modified
@@ -1,3 +1,4 @@
+import functools
 import json
 import re
 import textwrap
@@ -31,7 +32,7 @@ json_template = '''
     {
         "type": "float",
         "description": "Description of another value returned by the function, including possible values and their meanings."
-    },
+    }
   ],
   "errors": [
     {
@@ -77,17 +78,74 @@ format_spec_c_slashes = {
 
 format_spec_c = format_spec_c_multiline
 
+_DECODER = json.JSONDecoder()
+
+
+# Shared indent strings for the subsequent lines of section items
+_INDENTS = tuple(' ' * i for i in range(13))
+
+
+def _get_indent(width):
+    return _INDENTS[width] if 0 <= width < len(_INDENTS) else ' ' * width
+
+
+def _colon_offset(head):
+    # Equivalent to item_desc.find(':') + 2 on the full item text, but only searches the short head
+    colon = head.find(':')
+    return (colon if colon != -1 else len(head)) + 2
+
+
+# Formatters return the item text along with the offset just past its first colon
+def _format_parameter(item):
+    head = f"{item['name']} ({item['type']})"
+    return f"{head}: {item['description']}", _colon_offset(head)
+
+
+def _format_return(item):
+    head = f"{item['type']}"
+    return f"{head}: {item['description']}", _colon_offset(head)
+
+
+def _format_error(item):
+    head = f"{item['name']}"
+    return f"{head}: {item['description']}", _colon_offset(head)
+
+
+def _format_example(item):
+    item_desc = f"{item['description']}\n  {item['code']}"
+    return item_desc, item_desc.find(':') + 2
+
+
+# (func_data key, section heading, item formatter); notes are plain strings and need no formatter
+_SECTIONS = (
+    ('parameters', 'Parameters:', _format_parameter),
+    ('returns', 'Returns:', _format_return),
+    ('errors', 'Errors:', _format_error),
+    ('examples', 'Examples:', _format_example),
+    ('notes', 'Notes:', None)
+)
+
+
+@functools.lru_cache(maxsize=32)
+def _get_wrapper(width, initial_indent, subsequent_indent):
+    # TextWrapper compiles its splitting regexes on construction, so share instances between calls.
+    # wrap() does not mutate the wrapper, which makes the cached instances safe to reuse.
+    return textwrap.TextWrapper(width=width,
+                                initial_indent=initial_indent,
+                                subsequent_indent=subsequent_indent,
+                                replace_whitespace=True,
+                                break_on_hyphens=False)
+
 
 def extract_json(text):
     """
-    Extracts a JSON object from a given string, assuming it starts with '{' and ends
-    with '}'.
+    Extracts the first JSON object embedded in a given string.
 
-    This function finds the first occurrence of '{' in the input text, then searches
-    for the last occurrence of '}' to determine the bounds of the potential JSON
-    object. It checks if the indices are valid and that the start index comes before
-    the end index. If the JSON is valid, it returns the parsed JSON object;
-    otherwise, it returns None.
+    This function finds the first occurrence of '{' in the input text and decodes a
+    JSON object starting there. Decoding stops at the end of that object, so any
+    prose or stray braces following it are ignored. If the object starting at the
+    first '{' is not valid JSON, it returns None rather than falling back to an
+    object nested inside it.
 
     Parameters:
     text (string): The input string containing the potential JSON object to extract.
@@ -101,12 +159,128 @@ def extract_json(text):
                 'value'}')
     """
     start = text.find('{')  # Find the first occurrence of '{'
-    end = text.rfind('}')  # Find the last occurrence of '}'
-    
-    if start == -1 or end == -1 or start > end:
-        return None  # Ensure valid indices and that start comes before end
+    if start == -1:
+        return None
+
+    try:
+        # raw_decode stops at the end of the object instead of requiring the rest of the text to be JSON
+        obj, _ = _DECODER.raw_decode(text, start)
+    except json.JSONDecodeError:
+        # A later '{' would most likely open one of the malformed object's nested parameters, which is not a
+        # function description
+        return None
+    return obj
+
+
+def _format_text(text, width, prefix='', subsequent_indent='  '):
+    """
+    Formats text into multiple lines with adjustable width, prefix, and indentation.
+
+    This function uses the `textwrap` module to wrap a given text into multiple
+    lines. The wrapping occurs at a specified maximum width, with optional prefix
+    and subsequent indentation settings. It returns a list of formatted lines.
+
+    Parameters:
+    text (string): The original text that needs to be wrapped.
+    width (integer): The maximum width at which the text should be wrapped.
+    prefix (string): Optional prefix to add to each line. Defaults to an empty
+                string.
+    subsequent_indent (string): Optional indentation for subsequent lines. Defaults
+                to a single space character.
+
+    Returns:
+    list of strings: A list of formatted text lines.
+
+    Examples:
+    Formats the text 'This is a long line that needs to be wrapped.' into multiple
+     lines.   _format_text('This is a long line that needs to be wrapped.', 20)
+
+    Notes:
+    The `textwrap` module must be installed and imported for this function to work
+     correctly.
+    """
+    # Text that already fits on one line comes back unchanged from TextWrapper, provided it has no
+    # characters it would replace and no trailing space it would drop
+    if text and len(prefix) + len(text) <= width and text[-1] != ' ' and text.isprintable():
+        return [prefix + text]
+
+    # Handles text wrapping and adds the line prefix to all lines
+    wrapper = _get_wrapper(width, prefix, subsequent_indent)
+    wrapped_lines = wrapper.wrap(text)
+    return wrapped_lines
+
+
+def _build_renderer(format_spec):
+    # Specializes rendering for one format spec, so the per-call path has no spec lookups or branches
+    line_prefix = format_spec.get('line_prefix', '')
+    start_marker = format_spec.get('start', '')
+    end_marker = format_spec.get('end', '')
+    start_same_line = format_spec.get('start_same_line', False)
+    forbidden = format_spec.get('forbidden')
+    # A single alternation scans each line once regardless of how many substrings are forbidden
+    forbidden_re = re.compile('|'.join(map(re.escape, forbidden))) if forbidden else None
+    format_text = _format_text
+
+    def add_prefix(lines):
+        # Python docstrings have no line prefix, so their lines can be used as-is
+        return (line_prefix + line for line in lines) if line_prefix else lines
 
-    return json.loads(text[start:end+1])
+    if forbidden_re is None:
+        def emit(doc_string, lines):
+            # Nothing can be rejected, so the lines are appended without being scanned
+            doc_string.extend(add_prefix(lines))
+            return True
+    else:
+        def emit(doc_string, lines):
+            # Appends wrapped lines with the line prefix applied, rejecting them if any contains a forbidden substring
+            for line in lines:
+                if forbidden_re.search(line):
+                    return False
+            doc_string.extend(add_prefix(lines))
+            return True
+
+    def render(func_data, max_width, max_indent):
+        doc_string = []
+        append = doc_string.append
+        get = func_data.get
+
+        if get('summary'):
+            if not emit(doc_string, format_text(func_data['summary'], max_width, subsequent_indent='')):
+                return None
+            append(line_prefix)
+
+        if get('description'):
+            if not emit(doc_string, format_text(func_data['description'], max_width, subsequent_indent='')):
+                return None
+
+        for section_key, section_heading, formatter in _SECTIONS:
+            section_data = get(section_key)
+            if section_data:
+                append(line_prefix)
+                append(line_prefix + section_heading)
+                # Single-item sections like 'returns' may be given as a bare object rather than a list
+                items = section_data if isinstance(section_data, list) else (section_data,) if isinstance(section_data, dict) else ()
+                for item in items:
+                    if formatter is None:
+                        item_desc, colon_pos = item, item.find(':') + 2
+                    else:
+                        item_desc, colon_pos = formatter(item)
+                    subsequent_indent = _get_indent(min(max_indent, colon_pos))
+                    if not emit(doc_string, format_text(item_desc, max_width, subsequent_indent=subsequent_indent)):
+                        return None
+
+        if start_same_line:
+            # The first line follows the start marker directly instead of taking the line prefix
+            doc_string[0] = start_marker + doc_string[0][len(line_prefix):]
+            return '\n'.join(doc_string) + '\n' + end_marker
+        else:
+            return start_marker + '\n' + '\n'.join(doc_string) + '\n' + end_marker
+
+    return render
+
+
+# Renderers for the built-in specs are built once at import time
+_RENDERERS = {id(spec): _build_renderer(spec) for spec in (format_spec_python, format_spec_c_multiline, format_spec_c_slashes)}
 
 
 def generate_documentation(func_data, format_spec, max_width=80, max_indent=12):
@@ -137,90 +311,7 @@ def generate_documentation(func_data, format_spec, max_width=80, max_indent=12):
 
     Notes:
     """
-    line_prefix = format_spec.get('line_prefix', '')
-    start_marker = format_spec.get('start', '')
-    end_marker = format_spec.get('end', '')
-
-    def format_text(text, width, prefix='', subsequent_indent='  '):
-        """
-        Formats text into multiple lines with adjustable width, prefix, and indentation.
-
-        This function uses the `textwrap` module to wrap a given text into multiple
-        lines. The wrapping occurs at a specified maximum width, with optional prefix
-        and subsequent indentation settings. It returns a list of formatted lines.
-
-        Parameters:
-        text (string): The original text that needs to be wrapped.
-        width (integer): The maximum width at which the text should be wrapped.
-        prefix (string): Optional prefix to add to each line. Defaults to an empty
-                    string.
-        subsequent_indent (string): Optional indentation for subsequent lines. Defaults
-                    to a single space character.
-
-        Returns:
-        list of strings: A list of formatted text lines.
-
-        Examples:
-        Formats the text 'This is a long line that needs to be wrapped.' into multiple
-         lines.   format_text('This is a long line that needs to be wrapped.', 20)
-
-        Notes:
-        The `textwrap` module must be installed and imported for this function to work
-         correctly.
-        """
-        # Handles text wrapping and adds the line prefix to all lines
-        wrapper = textwrap.TextWrapper(width=width,
-                                       initial_indent=prefix,
-                                       subsequent_indent=subsequent_indent,
-                                       replace_whitespace=True)
-        wrapped_lines = wrapper.wrap(text)
-        return wrapped_lines
-
-    doc_string = []
-
-    if func_data.get('summary'):
-        doc_string.extend(format_text(func_data['summary'], max_width, subsequent_indent=''))
-        doc_string.append('')
-
-    if func_data.get('description'):
-        doc_string.extend(format_text(func_data['description'], max_width, subsequent_indent=''))
-
-    sections = {
-        'Parameters': lambda item: f"{item['name']} ({item['type']}): {item['description']}",
-        'Returns': lambda item: f"{item['type']}: {item['description']}",
-        'Errors': lambda item: f"{item['name']}: {item['description']}",
-        'Examples': lambda item: f"{item['description']}\n  {item['code']}",
-        'Notes': lambda item: item
-    }
-
-    for section_title, formatter in sections.items():
-        section_data = func_data.get(section_title.lower())
-        if section_data:
-            doc_string.append('')
-            doc_string.append(section_title + ':')
-            if isinstance(section_data, list):
-                for item in section_data:
-                    item_desc = formatter(item)
-                    colon_pos = item_desc.find(':') + 2
-                    subsequent_indent = ' ' * (min(max_indent, colon_pos))
-                    formatted_text = format_text(item_desc, max_width, subsequent_indent=subsequent_indent)
-                    doc_string.extend(formatted_text)
-            elif isinstance(section_data, dict):  # For single-item sections like 'returns'
-                item_desc = formatter(section_data)
-                colon_pos = item_desc.find(':') + 2
-                subsequent_indent = ' ' * (min(max_indent, colon_pos))
-                formatted_text = format_text(item_desc, max_width, subsequent_indent=subsequent_indent)
-                doc_string.extend(formatted_text)
-                
-    # check for forbidden substrings
-    for forbidden in format_spec.get('forbidden', []):
-        for line in doc_string:
-            if forbidden in line:
-                return None
-                
-    if format_spec.get('start_same_line', False):
-        body = '\n'.join([line_prefix + line for line in doc_string[1:]])
-        return start_marker + doc_string[0] + '\n' + body + '\n' + end_marker
-    else:
-        body = '\n'.join([line_prefix + line for line in doc_string])
-        return start_marker + '\n' + body + '\n' + end_marker
+    renderer = _RENDERERS.get(id(format_spec))
+    if renderer is None:
+        renderer = _build_renderer(format_spec)
+    return renderer(func_data, max_width, max_indent)
@@ -3,15 +3,33 @@ python_specification = {
     "function_definition": ["function", ["identifier"]]
 }
 
+# Node types whose contents can never hold a class or function
+python_literal_kinds = frozenset(("comment", "concatenated_string", "float", "integer", "string"))
+
+
+# Node types are matched with a set lookup, bound as a C-level callable so no Python frame is created per node
+is_function_declarator = frozenset(("function_declarator", "parenthesized_declarator")).__contains__
+is_function_identifier = frozenset(("field_identifier", "identifier")).__contains__
+
 
 cpp_specification = {
     "class_specifier": ["class", ["type_identifier"]],
-    "function_definition": ["function", [lambda nt: nt=="function_declarator" or nt=="parenthesized_declarator", lambda nt: nt == "field_identifier" or nt == "identifier"]]
+    "function_definition": ["function", [is_function_declarator, is_function_identifier]]
 }
 
+cpp_literal_kinds = frozenset(("char_literal", "comment", "concatenated_string", "number_literal", "preproc_arg",
+                               "raw_string_literal", "string_literal"))
+
 
 language_specifications = {
     "c": cpp_specification,
     "cpp": cpp_specification,
     "python": python_specification
 }
+
+
+literal_kinds = {
+    "c": cpp_literal_kinds,
+    "cpp": cpp_literal_kinds,
+    "python": python_literal_kinds
+}
@@ -1,8 +1,17 @@
-from docstrings import DocstringService
-from ollama import OllamaService
 import argparse
+import concurrent.futures
 import logging
-import samples
+import os
+import shutil
+import tempfile
+
+
+# Logging levels indexed by the --log-level option: no logs, brief logs, verbose logs
+_LOG_LEVELS = (logging.CRITICAL, logging.INFO, logging.DEBUG)
+
+# The console handler is created once and shared, so calling get_logger again does not print every message twice
+_console_handler = logging.StreamHandler()
+_console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 
 
 def get_arguments():
@@ -33,10 +42,20 @@ def get_arguments():
     # Arguments for listing, installing, and choosing models
     parser.add_argument('--install-model', type=str, metavar='MODEL_NAME',
                         help='Install a model by name onto the Ollama server.')
+    parser.add_argument('--keep-alive', type=str, default='30m', metavar='DURATION',
+                        help='Set how long the Ollama server keeps the model loaded after each request, e.g. 30m or 1h. Defaults to 30m. Has no effect after luci exits if luci started the server itself, since the server is then stopped.')
     parser.add_argument('--list', action='store_true',
                         help='List all installed models available on the Ollama server.')
     parser.add_argument('--model', type=str, default='llama3',
                     help='Specify the model to operate on. Defaults to llama3.')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always query the model instead of reusing responses to identical prompts.')
+    # Matching the server's parallel request slots keeps it busy without queueing requests behind one another
+    num_parallel = os.environ.get('OLLAMA_NUM_PARALLEL', '')
+    parser.add_argument('--parallel', type=int, default=int(num_parallel) if num_parallel.isdigit() and int(num_parallel) >= 1 else 4, metavar='N',
+                        help='Set the number of functions whose queries are sent to the Ollama server at the same time, across all files being documented. Defaults to OLLAMA_NUM_PARALLEL if it is set to at least 1, otherwise 4. Queries run on a pool of 16 threads, so values above 16 have the same effect as 16.')
+    parser.add_argument('--query-timeout', type=float, default=300, metavar='SECONDS',
+                        help='Set how long to wait for the Ollama server to send more of a response, including while the request is queued behind others, before the attempt fails. Defaults to 300. Use 0 to wait indefinitely.')
 
     
     # Arguments for specifying host and port
@@ -53,8 +72,11 @@ def get_arguments():
     # Parse the arguments
     args = parser.parse_args()
     
-    args.example_json = samples.example_json
-    args.example_function = samples.example_function
+    # The prompt samples are only needed when there are files to document
+    if args.filenames:
+        import samples
+        args.example_json = samples.example_json
+        args.example_function = samples.example_function
 
     return args
 
@@ -84,25 +106,69 @@ def get_logger(args):
 
     Notes:
     This function relies on the 'logging' library to handle logging configuration.
-     Ensure this library is installed and used correctly.
+     Ensure this library is installed and used correctly. Calling it again only
+     changes the log level; the console handler is added once.
     """
     logger = logging.getLogger(__name__)
-    if args.log_level == 0:
-        logger.setLevel(logging.CRITICAL)  # No logs shown
-    elif args.log_level == 1:
-        logger.setLevel(logging.INFO)  # Brief logs
-    elif args.log_level == 2:
-        logger.setLevel(logging.DEBUG)  # Verbose logs
-
-    # Create console handler and set level to debug
-    ch = logging.StreamHandler()
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    ch.setFormatter(formatter)
-    logger.addHandler(ch)
+    # argparse restricts --log-level to 0-2, so the index is always in range
+    logger.setLevel(_LOG_LEVELS[args.log_level])
+
+    if _console_handler not in logger.handlers:
+        logger.addHandler(_console_handler)
 
     return logger
 
 
+def write_file_atomically(filename, contents):
+    """
+    Replaces the contents of a file atomically.
+
+    The new contents are written to a temporary file in the same directory, which
+    is given the original file's permissions and then moved over the original. An
+    interrupted save therefore leaves either the old or the new file, never a
+    truncated one. If filename is a symbolic link, the file it points to is
+    replaced and the link is left in place.
+
+    Parameters:
+    filename (string): The path of the file to replace.
+    contents (string): The new contents of the file.
+
+    Returns:
+    void: Does not return any value.
+
+    Errors:
+    OSError: Thrown if the temporary file cannot be written or moved into place. The
+                original file is left unchanged.
+
+    Examples:
+    Saves modified source code over the original file.
+     write_file_atomically('example.py', modified_file)
+
+    Notes:
+    The file's owner and group are kept where the user running luci is allowed to
+     set them. Otherwise the new file belongs to that user.
+    """
+    # Replacing a symbolic link would turn it into a regular file and leave its target unedited
+    filename = os.path.realpath(filename)
+    directory = os.path.dirname(filename)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.luci-', suffix='.tmp')
+    try:
+        # A buffer large enough for typical source files lets the whole file go out in one write
+        with os.fdopen(fd, 'w', buffering=1 << 20) as outfile:
+            outfile.write(contents)
+        shutil.copymode(filename, temp_path)
+        if hasattr(os, 'chown'):
+            status = os.stat(filename)
+            try:
+                os.chown(temp_path, status.st_uid, status.st_gid)
+            except PermissionError:
+                pass
+        os.replace(temp_path, filename)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
 def main():
     """
     The main entry point for processing files and generating docstrings. This
@@ -141,27 +207,64 @@ def main():
     if args.strip and (args.create or args.update):
         logger.critical(f'Critical error: cannot use -s with -c or -u')    
         exit(1)
+
+    if args.parallel < 1:
+        logger.critical(f'Critical error: --parallel must be at least 1')
+        exit(1)
+
+    if args.query_timeout < 0:
+        logger.critical(f'Critical error: --query-timeout cannot be negative')
+        exit(1)
         
+    # Imports are deferred to the branches that use them so that --list and --install-model start quickly
     if args.list:
+        from ollama import OllamaService
         models = OllamaService.get_models(args, logger)
         print('-' * 79)
         for model in models:
             print(f"{model['name']}")
         
     if args.install_model:
+        from ollama import OllamaService
         OllamaService.install_model(args, logger)
-        
+
+    if not args.filenames:
+        return
+
     # Create the docstring service
+    from docstrings import DocstringService
     docstring_service = DocstringService(args, logger)
 
-    # Process each file with the document_file function
+    # Decorated filenames naming the same file are merged so that each file is parsed and written once.
+    # Otherwise the last of them to be saved would discard the changes made for the others.
+    function_paths_by_file = {}
     for decorated_filename in args.filenames:
-        parts = decorated_filename.split(':')
-        filename = parts[0]
-        function_paths = None if len(parts) <= 1 else parts[1:]
-        # Call the document_file function with the filename and list of options
-        modified_file, reports, modified = docstring_service.document_file(filename, function_paths)
+        filename, separator, decorations = decorated_filename.partition(':')
+        if separator and function_paths_by_file.get(filename, []) is not None:
+            function_paths_by_file.setdefault(filename, []).extend(decorations.split(':'))
+        else:
+            # An undecorated filename examines every function in the file
+            function_paths_by_file[filename] = None
 
+    def document(filename):
+        # Call the document_file function with the filename and list of options
+        return filename, docstring_service.document_file(filename, function_paths_by_file[filename])
+
+    # Files are documented concurrently since most of the time is spent waiting on Ollama. Nothing is reported
+    # until every file is done, so that previews and prompts to the user are not interleaved with the log output
+    # of files still being documented. Results are then reported in the order the files were given.
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(function_paths_by_file)))
+    try:
+        futures = [executor.submit(document, filename) for filename in function_paths_by_file]
+        results = [future.result() for future in futures]
+    except BaseException:
+        # Files that have not started are dropped, so that Ctrl+C or a failure stops luci instead of first
+        # documenting every queued file
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    for filename, (modified_file, reports, modified) in results:
         if args.report and reports is not None and len(reports) > 0:
             print('-' * 79)
             for report in reports:
@@ -175,7 +278,7 @@ def main():
 
             if args.modify:
                 save_file = not args.preview
-    
+
                 # Only ask for user confirmation if 'preview' or 'report' option is enabled
                 if args.preview or args.report:
                     user_response = input(f'\nDo you want to save these modifications to {filename}? (y/N) ').strip().lower()
@@ -184,12 +287,11 @@ def main():
 
                 # Check the save_file flag to decide whether to save the file
                 if save_file:
-                    with open(filename, 'w') as outfile:
-                        outfile.write(modified_file)
+                    write_file_atomically(filename, modified_file)
                     print(f'Updated {filename}')
                 else:
                     print(f'{filename} was NOT updated.')
-        
+    
 
 if __name__ == '__main__':
     main()
@@ -1,9 +1,71 @@
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import atexit
+import collections
+import concurrent.futures
+import hashlib
 import json
+import logging
+import os
 import requests
 import subprocess
+import threading
+import time
+import types
+
+try:
+    # orjson is optional; it parses and serializes considerably faster than the standard library
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+
+# Used by queries that are not given options, matching the command-line defaults
+DEFAULT_OPTIONS = types.SimpleNamespace(host='localhost', port=11434, model='llama3', no_cache=False, keep_alive='30m',
+                                        query_timeout=300)
+
 
 class OllamaService:
     _instance = None  # Singleton instance placeholder
+    _start_lock = threading.Lock()  # Prevents concurrent callers from spawning more than one server
+    _session = None  # Shared HTTP session placeholder
+    _session_lock = threading.Lock()
+    _executor = None  # Worker threads for queries made from async code
+    QUERY_WORKERS = 16
+    _installed_models = set()  # (host, port, model) keys that the server has confirmed are installed
+    _endpoint_cache = {}  # API endpoint URLs keyed by (host, port)
+    _generate_prefix_cache = {}  # Serialized /api/generate payloads up to the prompt, keyed by model, keep-alive, and limits
+    _model_name_cache = {}  # (models, names, base names) for the last model list seen per (host, port)
+    _tags_cache = {}  # (timestamp, models) from the last /api/tags response per (host, port)
+    TAGS_TTL = 30  # Seconds for which a model list is reused
+    _response_cache = collections.OrderedDict()  # (timestamp, response) keyed by a digest of the server, model, and prompt
+    _response_cache_lock = threading.Lock()
+    # Sized for the validation verdicts and finished docstrings of a repository-wide run, which persist between runs
+    RESPONSE_CACHE_SIZE = 16384
+    # Seconds before a cached response is considered stale. Keys already include the server, model, limits, and
+    # prompt, so this only guards against a model being replaced under the same name, and outlasts the runs in between.
+    RESPONSE_CACHE_TTL = 30 * 24 * 3600
+    # Cached responses are kept in this file between runs, so rerunning on unchanged code does not query again
+    RESPONSE_CACHE_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                                       'luci', 'responses.json')
+    _response_cache_loaded = False
+    _response_cache_dirty = False
+    # (connect, read) timeouts in seconds. The read timeout bounds the wait between received bytes,
+    # so pulls and streamed generations only need enough headroom for the slowest single step.
+    TAGS_TIMEOUT = (3, 10)
+    PULL_TIMEOUT = (3, 600)
+    # Generations use the read timeout from options.query_timeout, since it also runs while a request waits in the
+    # server's queue before its first byte, and how long that takes depends on the host
+    GENERATE_CONNECT_TIMEOUT = 3
+    # The context window requested for every generation. It holds the fixed prompt prefixes plus typical function
+    # code, so the prefix is never truncated and the server can reuse its cached evaluation between prompts.
+    # Requesting the same size each time also keeps the server from reloading the model to resize the context.
+    NUM_CTX = 8192
 
     def __new__(cls):
         """
@@ -28,7 +90,155 @@ class OllamaService:
             cls._instance = super(OllamaService, cls).__new__(cls)
             cls.ollama_process = None  # Process placeholder
         return cls._instance
-    
+
+    @classmethod
+    def get_session(cls):
+        """
+        Returns the HTTP session shared by all requests to the Ollama server.
+
+        The session is created on first use. It keeps connections to the server alive
+        between calls, so repeated requests to the same host and port reuse a pooled
+        connection instead of opening a new one each time.
+
+        Parameters:
+        cls (class): The OllamaService class.
+
+        Returns:
+        requests.Session: The shared session.
+
+        Examples:
+        Sends a request through the shared session.
+         OllamaService.get_session().get(url)
+        """
+        with cls._session_lock:
+            if cls._session is None:
+                session = requests.Session()
+                # Only failed connections are retried, since a request that reached the server may have been acted on
+                retries = Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.5)
+                # Sized so every query worker and documenting thread can hold its own pooled connection
+                session.mount('http://', HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=retries))
+                # Every request body is JSON, so the header is set once instead of being passed per call
+                session.headers.update({'Connection': 'keep-alive', 'Content-Type': 'application/json'})
+                cls._session = session
+        return cls._session
+
+    @classmethod
+    def get_executor(cls):
+        """
+        Returns the thread pool used to run queries on behalf of async callers.
+
+        The pool is created on first use. Its threads share the HTTP session, which is
+        safe here because each request is independent and the session's connection
+        pool is thread-safe.
+
+        Parameters:
+        cls (class): The OllamaService class.
+
+        Returns:
+        concurrent.futures.ThreadPoolExecutor: The shared thread pool.
+
+        Examples:
+        Runs a query in the pool.   OllamaService.get_executor().submit(ollama.query,
+                    prompt, options, logger)
+        """
+        with cls._session_lock:
+            if cls._executor is None:
+                cls._executor = concurrent.futures.ThreadPoolExecutor(max_workers=cls.QUERY_WORKERS)
+        return cls._executor
+
+    @classmethod
+    def close(cls):
+        """
+        Releases the shared thread pool and HTTP session.
+
+        The pool is shut down and the session's pooled connections are closed. Both are
+        created again on next use, so closing is safe even if queries follow.
+
+        Parameters:
+        cls (class): The OllamaService class.
+
+        Returns:
+        void: Does not return any value.
+
+        Examples:
+        Closes the pooled connections to the server.   OllamaService.close()
+        """
+        with cls._session_lock:
+            if cls._executor is not None:
+                cls._executor.shutdown()
+                cls._executor = None
+            if cls._session is not None:
+                cls._session.close()
+                cls._session = None
+
+    @classmethod
+    def get_endpoints(cls, options):
+        """
+        Returns the Ollama API endpoint URLs for the host and port in options.
+
+        The URLs are built once per host and port and reused by later calls. The name
+        'localhost' is replaced with the IPv4 loopback address that Ollama listens on.
+
+        Parameters:
+        cls (class): The OllamaService class.
+        options (object): An object containing host and port information for the API
+                    endpoint.
+
+        Returns:
+        dictionary: The 'tags', 'pull', and 'generate' endpoint URLs.
+
+        Examples:
+        Gets the URL used to generate text.
+         OllamaService.get_endpoints(options)['generate']
+        """
+        key = (options.host, options.port)
+        endpoints = cls._endpoint_cache.get(key)
+        if endpoints is None:
+            # Resolving 'localhost' may try ::1 first, which Ollama does not bind by default, costing a failed
+            # connection attempt (about two seconds on Windows) for every new connection
+            host = '127.0.0.1' if options.host == 'localhost' else options.host
+            base_url = f'http://{host}:{options.port}/api'
+            endpoints = {
+                'tags': f'{base_url}/tags',
+                'pull': f'{base_url}/pull',
+                'generate': f'{base_url}/generate'
+            }
+            cls._endpoint_cache[key] = endpoints
+        return endpoints
+
+    @classmethod
+    def invalidate_model_cache(cls):
+        """
+        Forgets which models have been confirmed as installed.
+
+        Parameters:
+        cls (class): The OllamaService class.
+
+        Returns:
+        void: Does not return any value.
+
+        Examples:
+        Forces the next query to check the server's model list again.
+         OllamaService.invalidate_model_cache()
+        """
+        cls._installed_models.clear()
+
+    @classmethod
+    def invalidate_tags(cls):
+        """
+        Discards the cached model lists so the next lookup asks the server again.
+
+        Parameters:
+        cls (class): The OllamaService class.
+
+        Returns:
+        void: Does not return any value.
+
+        Examples:
+        Forces get_models to fetch a fresh model list.   OllamaService.invalidate_tags()
+        """
+        cls._tags_cache.clear()
+
     @staticmethod
     def get_models(options, logger):
         """
@@ -58,15 +268,23 @@ class OllamaService:
                     options and logger objects.   get_models({'host': 'example.com',
                     'port': 8080}, logger)
         """
-        url = f"http://{options.host}:{options.port}/api/tags"
+        # The model list rarely changes, so a recent response is reused instead of asking the server again
+        key = (options.host, options.port)
+        cached = OllamaService._tags_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < OllamaService.TAGS_TTL:
+            return cached[1]
+
+        url = OllamaService.get_endpoints(options)['tags']
         
         try:
-            response = requests.get(url)
+            response = OllamaService.get_session().get(url, timeout=OllamaService.TAGS_TIMEOUT)
             response.raise_for_status()  # This will raise an exception for HTTP errors
-            data = response.json()
+            data = json_loads(response.content)
             models = data.get("models", [])
+            OllamaService._tags_cache[key] = (time.monotonic(), models)
             return models
         except requests.RequestException as e:
+            OllamaService.invalidate_tags()
             logger.error(f"An error occurred: {e}")
             return None
 
@@ -92,20 +310,24 @@ class OllamaService:
         Checks if a specific model is installed using options and logger.
          is_model_installed(options, logger)
         """
-        models = OllamaService.get_models(options, logger)    
-        
-        target_parts = options.model.split(':')
-        for model in models:
-            model_parts = model.get("name").split(':')
-            matches = True
-            for i in range(len(target_parts)):
-                if target_parts[i] != model_parts[i]:
-                    matches = False
-                    break
-            if matches:
-                return True
-                
-        return False
+        models = OllamaService.get_models(options, logger)
+        if not models:
+            return False
+
+        # Build the name sets once per model list rather than splitting every name on each check
+        key = (options.host, options.port)
+        cached = OllamaService._model_name_cache.get(key)
+        if cached is None or cached[0] is not models:
+            names = frozenset(model.get("name") for model in models)
+            base_names = frozenset(name.split(':', 1)[0] for name in names)
+            cached = (models, names, base_names)
+            OllamaService._model_name_cache[key] = cached
+
+        # A target with a tag must match exactly, while an untagged target matches any tag of that model
+        target = options.model
+        if ':' in target:
+            return target in cached[1]
+        return target in cached[2]
     
     @staticmethod
     def install_model(options, logger):
@@ -140,8 +362,7 @@ class OllamaService:
         This method relies on the 'requests' library to make HTTP requests to the Ollama
          API.
         """
-        url = f"http://{options.host}:{options.port}/api/pull"
-        headers = {'Content-Type': 'application/json'}
+        url = OllamaService.get_endpoints(options)['pull']
         payload = {
             "name": options.install_model,
             "stream": False
@@ -149,21 +370,24 @@ class OllamaService:
 
         try:
             logger.info(f'Installing Ollama model {options.install_model}')
-            response = requests.post(url, headers=headers, data=json.dumps(payload))
+            response = OllamaService.get_session().post(url, data=json_dumps(payload),
+                                                        timeout=OllamaService.PULL_TIMEOUT)
             response.raise_for_status()  # Raises stored HTTPError, if one occurred.
-            response_text = response.text
-            response_json = json.loads(response_text)
+            response_json = json_loads(response.content)
             if response_json['status'] == 'success':
+                OllamaService.invalidate_model_cache()
+                OllamaService.invalidate_tags()
                 return True  # Server indicates success.
             else:
-                logger.critical(f'Ollama replied with failure message:\n\n{response_text}')
+                logger.critical(f'Ollama replied with failure message:\n\n{response.text}')
                 return False  # Server response is not success, handle accordingly.
         except requests.RequestException as e:
             logger.critical(f'Failed to install model {options.model}: {str(e)}')
             return {'error': str(e)}  # Handle exceptions and return an error message.
 
 
-    def query(self, prompt, options, logger):
+    def query(self, prompt, options=None, logger=None, use_cache=True, stop_when=None, max_tokens=None, stop=None,
+              store_response=True):
         """
         Queries the Ollama API with a given prompt and options.
 
@@ -177,7 +401,26 @@ class OllamaService:
         self (object): An instance of the class this function belongs to.
         prompt (string): The prompt used for generating text with Ollama.
         options (object): Options for the query, including model and host information.
-        logger (object): A logger object for logging messages.
+                    Defaults to the llama3 model on localhost port 11434.
+        logger (object): A logger object for logging messages. Defaults to this
+                    module's logger.
+        use_cache (boolean): Whether a cached response to the same prompt may be
+                    returned. A fresh response always replaces the cached one. Defaults
+                    to True.
+        stop_when (function): Optional predicate called with the response so far and
+                    the latest fragment as they stream in. Once it returns True, the rest
+                    of the response is not read and the server stops generating it.
+                    Defaults to None, which reads the whole response. Responses cut short
+                    by a lambda or nested function are not cached.
+        max_tokens (integer): Optional limit on the number of tokens generated, sent to
+                    the server as num_predict. Defaults to None, which leaves the
+                    response unbounded.
+        stop (list): Optional sequences at which the server stops generating. Defaults
+                    to None.
+        store_response (boolean): Whether a fresh response is stored in the cache.
+                    Callers that cache their own result derived from the response pass
+                    False, so the raw response does not take up a second entry.
+                    Defaults to True.
 
         Returns:
         string|dict: The generated text response from Ollama, or an error message if an
@@ -196,34 +439,325 @@ class OllamaService:
         This function relies on the `requests` library to send an HTTP request to the
          Ollama API. Ensure this library is installed for proper operation.
         """
-        if self.ollama_process is None:
-            self.start()
-            
-        if not OllamaService.is_model_installed(options, logger):
-            logger.critical(f'Model "{options.model}" is not installed. Rerun script with --install-model {options.model}')
-            exit(0)
-
-        url = f'http://{options.host}:{options.port}/api/generate'
-        headers = {'Content-Type': 'application/json'}
-        data = {'model': options.model, 'prompt': prompt, 'stream': False}
+        options = options or DEFAULT_OPTIONS
+        logger = logger or logging.getLogger(__name__)
+
+        stop = tuple(stop) if stop else None
+        cache_key = None
+        # A response cut short by stop_when is only complete for that predicate, so the predicate is part of the key.
+        # Lambdas and closures share their qualified name with other predicates, so their responses are not cached.
+        stopped_by = None
+        if stop_when is not None:
+            stopped_by = f'{getattr(stop_when, "__module__", None)}.{getattr(stop_when, "__qualname__", "<unnamed>")}'
+        if (use_cache or store_response) and not options.no_cache and (stopped_by is None or '<' not in stopped_by):
+            # Responses generated under different limits may differ, so the limits are part of the key as well, and so
+            # is the server, since two servers can serve different models under the same name
+            key_data = f'{options.host}\0{options.port}\0{options.model}\0{max_tokens}\0{stop}\0{stopped_by}\0{prompt}'
+            cache_key = hashlib.blake2b(key_data.encode('utf-8'), digest_size=16).digest()
+            if use_cache:
+                cached = OllamaService.get_cached_response(cache_key)
+                if cached is not None:
+                    return cached
+
         try:
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            # Return just the text response from Ollama
-            return response.json()['response']
+            # Return just the text response from Ollama, assembled from the streamed fragments
+            if stop_when is None:
+                response = ''.join(self.query_stream(prompt, options, logger, max_tokens, stop))
+            else:
+                response = ''
+                stream = self.query_stream(prompt, options, logger, max_tokens, stop)
+                try:
+                    for fragment in stream:
+                        response += fragment
+                        if stop_when(response, fragment):
+                            break
+                finally:
+                    # Closing the stream drops the connection, which tells the server to stop generating
+                    stream.close()
         except requests.RequestException as e:
             return {'error': str(e)}
 
-    def start(self):
+        if cache_key is not None and store_response:
+            OllamaService.cache_response(cache_key, response)
+        return response
+
+    @classmethod
+    def get_cached_response(cls, cache_key):
+        """
+        Looks up a previously cached response to a query.
+
+        Parameters:
+        cls (class): The OllamaService class.
+        cache_key (bytes): The digest of the server, model name, and prompt.
+
+        Returns:
+        string | None: The cached response, or None if there is no entry or it is older
+                    than RESPONSE_CACHE_TTL seconds.
+
+        Examples:
+        Looks up the response for a query key.
+         OllamaService.get_cached_response(cache_key)
+        """
+        with cls._response_cache_lock:
+            if not cls._response_cache_loaded:
+                cls.load_response_cache()
+            entry = cls._response_cache.get(cache_key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > cls.RESPONSE_CACHE_TTL:
+                del cls._response_cache[cache_key]
+                return None
+            cls._response_cache.move_to_end(cache_key)
+            return entry[1]
+
+    @classmethod
+    def cache_response(cls, cache_key, response):
+        """
+        Stores a query response, evicting the least recently used entry when full.
+
+        Parameters:
+        cls (class): The OllamaService class.
+        cache_key (bytes): The digest of the server, model name, and prompt.
+        response (string): The response returned by Ollama.
+
+        Returns:
+        void: Does not return any value.
+
+        Examples:
+        Caches the response for a query key.
+         OllamaService.cache_response(cache_key, response)
+        """
+        with cls._response_cache_lock:
+            if not cls._response_cache_loaded:
+                cls.load_response_cache()
+            cls._response_cache[cache_key] = (time.time(), response)
+            cls._response_cache.move_to_end(cache_key)
+            if len(cls._response_cache) > cls.RESPONSE_CACHE_SIZE:
+                cls._response_cache.popitem(last=False)
+            cls._response_cache_dirty = True
+
+    @classmethod
+    def load_response_cache(cls):
+        """
+        Loads the responses cached by earlier runs and arranges for them to be saved.
+
+        Entries older than RESPONSE_CACHE_TTL seconds are dropped. A missing or
+        unreadable cache file is treated as an empty cache. The caller must hold the
+        response cache lock.
+
+        Parameters:
+        cls (class): The OllamaService class.
+
+        Returns:
+        void: Does not return any value.
+
+        Examples:
+        Loads the cache before its first lookup.   OllamaService.load_response_cache()
+        """
+        cls._response_cache_loaded = True
+        atexit.register(cls.save_response_cache)
+        try:
+            with open(cls.RESPONSE_CACHE_PATH, 'rb') as cache_file:
+                entries = json_loads(cache_file.read())
+            now = time.time()
+            # Oldest first, so that the entries stored longest ago are the first to be evicted
+            for key, (timestamp, response) in sorted(entries.items(), key=lambda item: item[1][0]):
+                if now - timestamp <= cls.RESPONSE_CACHE_TTL:
+                    cls._response_cache[bytes.fromhex(key)] = (timestamp, response)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logging.getLogger(__name__).debug(f'Not using the response cache file: {e}')
+        while len(cls._response_cache) > cls.RESPONSE_CACHE_SIZE:
+            cls._response_cache.popitem(last=False)
+
+    @classmethod
+    def save_response_cache(cls):
+        """
+        Writes the cached responses to the cache file if any were added.
+
+        The file is written under a temporary name and then moved into place, so a
+        concurrent run never reads a partially written cache.
+
+        Parameters:
+        cls (class): The OllamaService class.
+
+        Returns:
+        void: Does not return any value.
+
+        Examples:
+        Saves the cache when the interpreter exits.
+         atexit.register(OllamaService.save_response_cache)
+        """
+        with cls._response_cache_lock:
+            if not cls._response_cache_dirty:
+                return
+            entries = {key.hex(): entry for key, entry in cls._response_cache.items()}
+            cls._response_cache_dirty = False
+
+        temp_path = f'{cls.RESPONSE_CACHE_PATH}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(cls.RESPONSE_CACHE_PATH), exist_ok=True)
+            with open(temp_path, 'wb') as cache_file:
+                cache_file.write(json_dumps(entries))
+            os.replace(temp_path, cls.RESPONSE_CACHE_PATH)
+        except OSError as e:
+            logging.getLogger(__name__).debug(f'Could not save the response cache: {e}')
+
+    def query_stream(self, prompt, options=None, logger=None, max_tokens=None, stop=None):
+        """
+        Queries the Ollama API and yields the generated text as it arrives.
+
+        The request asks Ollama to stream its reply as newline-delimited JSON. Each
+        fragment of generated text is yielded as soon as its line is received, so
+        callers can process the response while generation is still in progress.
+
+        Parameters:
+        self (object): An instance of the class this function belongs to.
+        prompt (string): The prompt used for generating text with Ollama.
+        options (object): Options for the query, including model and host information.
+                    Defaults to the llama3 model on localhost port 11434.
+        logger (object): A logger object for logging messages. Defaults to this
+                    module's logger.
+        max_tokens (integer): Optional limit on the number of tokens generated, sent to
+                    the server as num_predict. Defaults to None.
+        stop (list): Optional sequences at which the server stops generating. Defaults
+                    to None.
+
+        Returns:
+        generator: Yields the fragments of the generated text in order.
+
+        Errors:
+        requests.RequestException: Thrown if there is a problem with the HTTP request to
+                    the Ollama API, if a line of the response is not valid JSON, or if
+                    Ollama reports an error while generating.
+
+        Examples:
+        Prints a response as it is generated.   for fragment in
+                    ollama.query_stream('This is a test prompt', options, logger):
+                    print(fragment, end='')
+        """
+        options = options or DEFAULT_OPTIONS
+        logger = logger or logging.getLogger(__name__)
+        self.ensure_model(options, logger)
+
+        url = OllamaService.get_endpoints(options)['generate']
+        # The rest of the payload only depends on the model, keep-alive, and output limits, so it is serialized once and
+        # only the prompt per call
+        stop = tuple(stop) if stop else None
+        keep_alive = getattr(options, 'keep_alive', None)
+        prefix_key = (options.model, keep_alive, max_tokens, stop)
+        prefix = OllamaService._generate_prefix_cache.get(prefix_key)
+        if prefix is None:
+            generate_options = {'num_ctx': OllamaService.NUM_CTX}
+            if max_tokens is not None:
+                generate_options['num_predict'] = max_tokens
+            if stop:
+                generate_options['stop'] = list(stop)
+            payload = {'model': options.model, 'stream': True, 'options': generate_options}
+            if keep_alive is not None:
+                # How long the server keeps the model loaded after the request, so later queries skip reloading it
+                payload['keep_alive'] = keep_alive
+            prefix = json_dumps(payload)[:-1] + b',"prompt":'
+            OllamaService._generate_prefix_cache[prefix_key] = prefix
+        data = prefix + json_dumps(prompt) + b'}'
+        # A query timeout of 0 waits for the server indefinitely
+        read_timeout = getattr(options, 'query_timeout', DEFAULT_OPTIONS.query_timeout) or None
+        with OllamaService.get_session().post(url, data=data, stream=True,
+                                              timeout=(OllamaService.GENERATE_CONNECT_TIMEOUT, read_timeout)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    try:
+                        chunk = json_loads(line)
+                    except ValueError as e:
+                        # A truncated or malformed line is a failed request, like any other transport error
+                        raise requests.RequestException(f'Malformed response from Ollama: {e}') from e
+                    if 'error' in chunk:
+                        raise requests.RequestException(chunk['error'])
+                    if chunk.get('done'):
+                        OllamaService.log_timings(chunk, logger)
+                    yield chunk.get('response', '')
+
+    @staticmethod
+    def log_timings(chunk, logger):
+        """
+        Logs where the server spent its time on a generation, at debug level.
+
+        Nearly all of luci's running time is spent in the server, evaluating the prompt
+        and then generating the response one token at a time, rather than in Python. The
+        timings reported with the final chunk of a response show which of the two
+        dominates, so they are the place to start when tuning prompts or models.
+
+        Parameters:
+        chunk (dict): The final chunk of a streamed /api/generate response.
+        logger (object): A logger object for logging messages.
+
+        Returns:
+        void: Does not return any value.
+
+        Examples:
+        Logs the timings of a finished generation.
+         OllamaService.log_timings(chunk, logger)
+
+        Notes:
+        Durations are reported by the server in nanoseconds. The prompt token count is
+         lower than the prompt's length when the server reuses an evaluated prefix.
+        """
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        eval_seconds = chunk.get('eval_duration', 0) / 1e9
+        eval_count = chunk.get('eval_count', 0)
+        rate = eval_count / eval_seconds if eval_seconds else 0.0
+        logger.debug(f"Ollama timings: load {chunk.get('load_duration', 0) / 1e9:.2f}s, "
+                     f"prompt {chunk.get('prompt_eval_count', 0)} tokens in {chunk.get('prompt_eval_duration', 0) / 1e9:.2f}s, "
+                     f"response {eval_count} tokens in {eval_seconds:.2f}s ({rate:.1f} tokens/s), "
+                     f"total {chunk.get('total_duration', 0) / 1e9:.2f}s")
+
+    def ensure_model(self, options, logger):
+        """
+        Makes sure the Ollama server is running and the requested model is installed.
+
+        The server is started if this service has not started it yet. Only the first
+        call for a given host, port, and model asks the server for its model list;
+        later calls reuse the confirmed result. The program exits if the model is not
+        installed.
+
+        Parameters:
+        self (object): An instance of the class this function belongs to.
+        options (object): Options for the query, including model and host information.
+        logger (object): A logger object for logging messages.
+
+        Returns:
+        void: Does not return any value.
+
+        Examples:
+        Checks that the model in options is available before querying it.
+         ensure_model(options, logger)
+        """
+        if self.ollama_process is None:
+            self.start(options)
+
+        # Only the first query for a model needs to ask the server whether it is installed
+        model_key = (options.host, options.port, options.model)
+        if model_key not in OllamaService._installed_models:
+            if not OllamaService.is_model_installed(options, logger):
+                logger.critical(f'Model "{options.model}" is not installed. Rerun script with --install-model {options.model}')
+                exit(0)
+            OllamaService._installed_models.add(model_key)
+
+    def start(self, options=None):
         """
         Starts an Ollama process to serve requests.
 
         This method initializes or restarts the Ollama process if it's not already
         running. It creates a new subprocess for the 'ollama' command with 'serve' as
-        its argument, and captures both stdout and stderr streams.
+        its argument, and discards its stdout and stderr streams. If options are given,
+        it then waits until the server answers requests, so the first query does not
+        race the server's startup.
 
         Parameters:
         self (object): The object instance of the class this method is called on.
+        options (object): Optional host and port information used to wait for the
+                    server to become ready. Defaults to None, which does not wait.
 
         Returns:
         void: Does not return any value. This method's primary effect is starting or
@@ -241,15 +775,54 @@ class OllamaService:
          system. If issues arise, it's recommended to check the subprocess creation or
          running status.
         """
-        if self.ollama_process is None:
-            self.ollama_process = subprocess.Popen(['ollama', 'serve'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with self._start_lock:
+            if self.ollama_process is None:
+                # Nothing reads the server's output, so piping it would eventually fill the pipe and stall the server
+                self.ollama_process = subprocess.Popen(['ollama', 'serve'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                # The server started here is stopped again when the interpreter exits instead of being left running
+                atexit.register(self.stop)
+                if options is not None:
+                    self.wait_until_ready(options)
+
+    def wait_until_ready(self, options, attempts=50, interval=0.1):
+        """
+        Waits for the Ollama server to accept requests.
+
+        The server is polled with short requests to its model list until one succeeds
+        or the attempts run out. If the server was already running, the first poll
+        succeeds immediately. Each poll gives up after 0.2 seconds, so the defaults wait
+        about five seconds when connections are refused outright and up to about fifteen
+        when every poll times out.
+
+        Parameters:
+        self (object): The object instance of the class this method is called on.
+        options (object): An object containing host and port information for the server.
+        attempts (integer): The maximum number of polls. Defaults to 50.
+        interval (float): The number of seconds to wait between polls. Defaults to 0.1.
+
+        Returns:
+        boolean: True if the server answered, or False if it did not become ready.
+
+        Examples:
+        Waits for the server with the default 50 polls.   wait_until_ready(options)
+        """
+        url = OllamaService.get_endpoints(options)['tags']
+        for _ in range(attempts):
+            try:
+                # Polled without the shared session, whose connection retries would stretch each poll out
+                requests.get(url, timeout=0.2)
+                return True
+            except requests.RequestException:
+                time.sleep(interval)
+        return False
 
     def stop(self):
         """
         Stops an Ollama process, if one exists.
 
         This function checks if an Ollama process is running and terminates it if so. It
-        then waits for the process to finish before returning.
+        then waits for the process to finish and closes the shared HTTP session before
+        returning. Calling it again, or after the process has exited, does nothing.
 
         Parameters:
         self (object): The instance of the class containing this method.
@@ -260,6 +833,11 @@ class OllamaService:
         Examples:
         Stops the Ollama process associated with an instance of a class.   stop()
         """
-        if self.ollama_process:
-            self.ollama_process.terminate()
-            self.ollama_process.wait()
+        with self._start_lock:
+            if self.ollama_process:
+                atexit.unregister(self.stop)
+                self.ollama_process.terminate()
+                self.ollama_process.wait()
+                self.ollama_process = None
+
+        OllamaService.close()
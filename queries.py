@@ -1,7 +1,26 @@
 import formatting
+import functools
+import hashlib
+import json
 import re
 
 
+# Bump when the prompts or docstring checks change, so that docstrings cached by earlier versions are not reused
+PROMPT_VERSION = 2
+
+# Output limits in tokens. A JSON description of even a large function fits well within the first, and the
+# verdict with its explanation within the second, so only runaway responses are cut short.
+DOCSTRING_MAX_TOKENS = 1024
+VALIDATION_MAX_TOKENS = 512
+
+# Pattern to find 'ANSWER:' followed by any amount of whitespace and then a word. Models often vary the case or
+# wrap the label or the word in markdown (e.g. '**Answer:** Correct'), so those are accepted as well.
+_ANSWER_RE = re.compile(r'\bANSWER[*_]*\s*:[\s*_`"\']*(\w+)', re.IGNORECASE)
+
+# A docstring enclosed in triple double quotes with no triple double quotes inside it
+_TRIPLE_QUOTED_RE = re.compile(r'"""(?:(?!""").)*"""', re.DOTALL)
+
+
 def generate_docstring_query(code, example_function, example_json):
     """
     Generates a JSON description of another function's documentation, including
@@ -36,19 +55,24 @@ def generate_docstring_query(code, example_function, example_json):
      the query string. Ensure that the input code snippet is correct and the JSON
      template is well-formed for proper operation.
     """
-    query = 'Refer to this JSON template for the following tasks:\n\n'    
-    query += formatting.json_template
-    query += '\n'
-    
+    return _docstring_query_prefix(example_function, example_json) + code
+
+
+@functools.lru_cache(maxsize=8)
+def _docstring_query_prefix(example_function, example_json):
+    # Everything before the code is the same for every function, so it is only assembled once per example
     instructions = 'Generate a JSON description of the following function:\n\n'
-    query += instructions
-    query += example_function
-    query += '\n\n'
-    query += example_json
-    query += '\n\n'
-    query += instructions
-    query += code
-    return query
+    return ''.join(('Refer to this JSON template for the following tasks:\n\n', _compact_json(formatting.json_template),
+                    '\n\n', instructions, example_function, '\n\n', _compact_json(example_json), '\n\n', instructions))
+
+
+def _compact_json(text):
+    # The indentation and line breaks of the JSON examples cost prompt tokens on every request without telling the
+    # model anything, so the examples are sent on a single line. Text that is not valid JSON is used as given.
+    try:
+        return json.dumps(json.loads(text))
+    except ValueError:
+        return text
 
 
 def generate_validation_query(code, example_json):
@@ -81,24 +105,33 @@ def generate_validation_query(code, example_json):
     This function is designed to provide a framework for validating docstrings in
      Python code. It may not cover all possible edge cases or error scenarios.
     """
-    instructions = f'Examine the following code and check that it conforms with these instructions:\n'
-    instructions += f'1. The docstring in the function must accurately reflect the code in the function.\n'
-    instructions += f'2. The docstring is consistent with any comments in the code.\n'
-    instructions += f'3. The docstring only discusses what is actually visible in the code. It should not make claims about functionality that is not visible in the code."\n'
-    instructions += f'\nIf all points are met, reply with "ANSWER: correct"\n'
-    instructions += f'If any point fails, respond with "ANSWER: incorrect: " followed by an explanation.\n\n'
-
-    query = instructions
-    query += f'def load_file(filename):\n'
-    query += f'    """ List all files in a directory """\n'
-    query += f'    with open(filename, "r") as infile:\n'
-    query += f'        file_content = infile.read()\n'
-    query += f'    return file_content\n\n'
-    query += f'ANSWER: incorrect: The function does not list files in a directory. It loads a file and returns the contents. It also does not adhere to the style conventions for docstrings.\n\n'
-    query += instructions
-    query += f'{code}\n\n'
-
-    return query
+    return f'{_VALIDATION_QUERY_PREFIX}{code}\n\n'
+
+
+def _build_validation_query_prefix():
+    # Everything before the code is the same for every function, so it is assembled once at import time
+    instructions = ''.join((
+        'Examine the following code and check that it conforms with these instructions:\n',
+        '1. The docstring in the function must accurately reflect the code in the function.\n',
+        '2. The docstring is consistent with any comments in the code.\n',
+        '3. The docstring only discusses what is actually visible in the code. It should not make claims about functionality that is not visible in the code."\n',
+        '\nIf all points are met, reply with "ANSWER: correct"\n',
+        'If any point fails, respond with "ANSWER: incorrect: " followed by an explanation.\n\n',
+    ))
+
+    return ''.join((
+        instructions,
+        'def load_file(filename):\n',
+        '    """ List all files in a directory """\n',
+        '    with open(filename, "r") as infile:\n',
+        '        file_content = infile.read()\n',
+        '    return file_content\n\n',
+        'ANSWER: incorrect: The function does not list files in a directory. It loads a file and returns the contents. It also does not adhere to the style conventions for docstrings.\n\n',
+        instructions,
+    ))
+
+
+_VALIDATION_QUERY_PREFIX = _build_validation_query_prefix()
 
 
 def generate_docstring(ollama, function_path, function_name, function_body, current_docstring, options, logger, special_instructions=None):
@@ -106,8 +139,9 @@ def generate_docstring(ollama, function_path, function_name, function_body, curr
     Generates a docstring for a given function using OLLAMA and formatting.
 
     This function takes in various parameters to generate a docstring. It queries
-    OLLAMA, formats the result, validates it, and returns the final docstring. If
-    any exceptions occur during the process, they are logged but not propagated.
+    OLLAMA, formats the result, checks that it forms a valid docstring, and returns
+    the final docstring. If any exceptions occur during the process, they are logged
+    but not propagated.
 
     Parameters:
     ollama (object): The OLLAMA object used to query for the docstring.
@@ -138,25 +172,105 @@ def generate_docstring(ollama, function_path, function_name, function_body, curr
 
     Notes:
     This function uses OLLAMA and formatting libraries to generate the docstring.
-     Ensure these libraries are installed for proper operation.
+     Ensure these libraries are installed for proper operation. Unless caching is
+     disabled, the finished docstring is cached against the function body, server, model,
+     and PROMPT_VERSION, so unchanged functions are not queried again. Retrying stops
+     early if the model returns the same failed response twice in a row.
     """
+    cache_key = None
+    if not options.no_cache:
+        key_data = f'docstring\0{PROMPT_VERSION}\0{options.host}\0{options.port}\0{options.model}\0{special_instructions}\0{function_body}'
+        cache_key = hashlib.blake2b(key_data.encode('utf-8'), digest_size=16).digest()
+        cached = ollama.get_cached_response(cache_key)
+        if cached is not None:
+            return cached
+
     query = generate_docstring_query(function_body, options.example_function, options.example_json)
     if special_instructions is not None:
-        query += '\n\nSpecial Instructions:\n'
-        query += special_instructions
+        query = f'{query}\n\nSpecial Instructions:\n{special_instructions}'
      
+    last_failure = None
     for i in range(options.attempts):
+        docstring = None
         try:
-            docstring = ollama.query(query, options, logger)
+            # The finished docstring is cached instead of the raw response, so the raw response is neither looked up
+            # nor stored
+            docstring = ollama.query(query, options, logger, use_cache=False, stop_when=_description_complete,
+                                     max_tokens=DOCSTRING_MAX_TOKENS, store_response=False)
             formatted = formatting.generate_documentation(formatting.extract_json(docstring), formatting.format_spec_python)
-            if validate_docstring(ollama, function_name, function_body, formatted, options, logger):
-                return formatted.strip('"').strip("'")
+            valid, report = check_docstring(formatted)
+            if valid:
+                new_docstring = formatted.strip('"').strip("'")
+                if cache_key is not None:
+                    ollama.cache_response(cache_key, new_docstring)
+                return new_docstring
+            logger.debug(report)
         except Exception as e:
             # We don't care about exceptions here, since we already just try again when we get bad results. Let's just log it for debug mode.
             logger.debug(f'Exception: {str(e)}')
+        # The same failed response twice in a row means the model answers this prompt deterministically, so the
+        # remaining attempts would only repeat it. Request errors are not model output and may clear up, so they are
+        # always retried.
+        if isinstance(docstring, str) and docstring == last_failure:
+            logger.debug('The model repeated a failed response; not retrying')
+            break
+        last_failure = docstring
     return None
 
 
+def _description_complete(response, fragment):
+    # Anything the model writes after the function's JSON description is discarded, so it need not be generated.
+    # The description can only be complete once a closing brace arrives, and it is told apart from the nested
+    # parameter objects by its top-level fields.
+    if '}' not in fragment:
+        return False
+    description = formatting.extract_json(response)
+    return isinstance(description, dict) and ('functionName' in description or 'summary' in description)
+
+
+def _verdict_complete(response, fragment):
+    # Only the model's verdict is used, so it need not go on generating once the verdict is given. A correct
+    # verdict is complete once its word is, while an incorrect one keeps its explanation up to the next blank line.
+    match = _ANSWER_RE.search(response)
+    if match is None or match.end() == len(response):
+        return False
+    if match.group(1).lower() == 'correct':
+        return True
+    return '\n\n' in response[match.end():]
+
+
+def check_docstring(docstring):
+    """
+    Checks that a docstring is a syntactically valid, simply quoted string literal.
+
+    The docstring is placed in a dummy function to check that it parses, and then
+    checked to be enclosed in triple double quotes with no triple double quotes
+    inside it. These checks run locally, without querying the model.
+
+    Parameters:
+    docstring (string): The docstring to be checked, including its quotes.
+
+    Returns:
+    boolean: A boolean indicating whether the docstring passed the checks.
+    string: A report of the failed check, or None if the checks passed.
+
+    Examples:
+    Checks a generated docstring before it is used.   check_docstring(formatted)
+    """
+    try:
+        # Compile the dummy function code to see if the docstring is syntactically correct. Compiling only parses
+        # the code, so nothing in it is executed.
+        dummy_code = f'def dummy_function():\n    {docstring}\n    pass\n'
+        compile(dummy_code, '<docstring>', 'exec')
+    except SyntaxError:
+        return False, 'Docstring syntax not valid'
+
+    if not _TRIPLE_QUOTED_RE.fullmatch(docstring):
+        return False, f'Failed simple string test (incorrect quoting): {docstring}'
+
+    return True, None
+
+
 def validate_docstring(ollama, function_name, function_body, docstring, options, logger):
     """
     Validates whether a given docstring is syntactically correct and matches certain
@@ -196,31 +310,20 @@ def validate_docstring(ollama, function_name, function_body, docstring, options,
     This function relies on the Ollama search engine for validation queries. Ensure
      that it is properly configured and functioning correctly.
     """
-    report = None
-
-    try:
-        # Attempt to parse the dummy function code to see if the docstring is syntactically correct
-        dummy_code = f'def dummy_function():\n    {docstring}\n    pass\n\ndummy_function()\n'
-        exec(dummy_code, {})
-    except SyntaxError:
-        return False, 'Docstring syntax not valid'
-
-    if not docstring.startswith('"""') or not docstring.endswith('"""') or '"""' in docstring[3:-3]:
-        report = f'Failed simple string test (incorrect quoting): {docstring}'
-    else:
+    valid, report = check_docstring(docstring)
+    if valid:
         query = generate_validation_query(function_body, options.example_json)
         for i in range(options.attempts):
-            result = ollama.query(query, options, logger)
-            # Pattern to find 'ANSWER:' followed by any amount of whitespace and then a word
-            pattern = r'ANSWER:\s*(\w+)'
-            # Use re.findall to extract all matching words
-            answers = re.findall(pattern, result)
-            valid = len(answers) > 0
-            for answer in answers:
-                if answer.lower() != 'correct':
-                    valid = False
-                    break
-            if valid:
+            result = ollama.query(query, options, logger, use_cache=(i == 0), stop_when=_verdict_complete,
+                                  max_tokens=VALIDATION_MAX_TOKENS)
+            if not isinstance(result, str):
+                # A failed request, such as a timeout, counts as a failed attempt
+                report = f"Validation query failed: {result['error']}"
+                logger.debug(report)
+                continue
+            # Use findall to extract all matching words
+            answers = _ANSWER_RE.findall(result)
+            if answers and all(answer.lower() == 'correct' for answer in answers):
                 return True, result
             report = result
 
@@ -49,7 +49,7 @@ example_json = '''
         }
     ],
     "notes": [
-        "This function relies on the 'ast' and 'astor' libraries to parse and generate Python source code, respectively. Ensure these libraries are installed and the source file is syntactically correct for proper operation."
+        "This function relies on the standard 'ast' library to parse and generate Python source code. Ensure the source file is syntactically correct for proper operation."
     ]
 }
 '''
@@ -63,10 +63,10 @@ def update_docstring(filename, function_name, new_docstring):
     for node in ast.walk(tree):
         if isinstance(node, ast.FunctionDef) and node.name == function_name:
             # Create a new docstring node
-            node.body.insert(0, ast.Expr(value=ast.Str(s=new_docstring)))
+            node.body.insert(0, ast.Expr(value=ast.Constant(value=new_docstring)))
             break
     
     # Write back the modified code
     with open(filename, "w") as file:
-        file.write(astor.to_source(tree))
+        file.write(ast.unparse(tree))
 '''
@@ -1,9 +1,26 @@
 class Transformer:
+    # Whether leaf nodes such as keywords, identifiers, and punctuation are entered. They can never be classes or
+    # functions, so transformers that only act on those can set this to False to skip them entirely.
+    visit_leaves = True
+    # Whether the nodes inside literals and comments, such as the pieces of a string, are entered. The literal itself
+    # is always entered; setting this to False only skips what lies within it.
+    visit_literals = True
+
     def __init__(self):
         self.qualified_scope_name = []
+        # The (scope name, qualified scope name) for each depth of qualified_scope_name, kept up to date as nodes
+        # are entered and left so that neither has to be recomputed from the whole stack when asked for
+        self._scope_names = [(None, '')]
 
     def before_enter(self, args):
-        self.qualified_scope_name.append(args['name'])
+        name = args['name']
+        self.qualified_scope_name.append(name)
+        if name:
+            scope_name, qualified_scope_name = self._scope_names[-1]
+            self._scope_names.append((name, f'{qualified_scope_name}.{name}' if qualified_scope_name else name))
+        else:
+            # Unnamed nodes stay within the enclosing scope
+            self._scope_names.append(self._scope_names[-1])
 
     def after_enter(self, args):
         pass
@@ -13,6 +30,7 @@ class Transformer:
     
     def after_leave(self, args):
         self.qualified_scope_name.pop()
+        self._scope_names.pop()
         
     def enter_class(self, args):
         pass
@@ -31,6 +49,9 @@ class Transformer:
 
     def leave_other(self, args):
         pass
+
+    def finish(self):
+        pass
     
     def get_qualified_scope_name(self):
         """
@@ -51,15 +72,14 @@ class Transformer:
         Get the qualified scope name for a given object instance.   qualified_scope_name
          = get_qualified_scope_name(self)
         """
-        return '.'.join(filter(None, self.qualified_scope_name))
+        return self._scope_names[-1][1]
 
     def get_scope_name(self):
         """
         Returns the name of the current scope.
 
-        This function returns the name of the current scope. It prints the qualified
-        scope name and then reduces it to get the last part, which represents the scope
-        name.
+        This function returns the name of the current scope, which is the innermost
+        named component of the qualified scope name. Unnamed scopes are skipped.
 
         Parameters:
         self (object): The object instance for which this method is called.
@@ -70,7 +90,6 @@ class Transformer:
         Examples:
         Get the name of the current scope.   scope_name = get_scope_name()
         """
-        print(self.qualified_scope_name)
-        reduced = filter(None, self.qualified_scope_name)
-        return reduced[-1] if reduced else None    
+        return self._scope_names[-1][0]
+
     
\ No newline at end of file
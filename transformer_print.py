@@ -1,11 +1,22 @@
 from uniparse import transform
+import sys
 import transformer
 
 
+# Shared indent strings for the nesting levels of typical code
+_INDENTS = tuple('   ' * i for i in range(32))
+
+
+def _get_indent(level):
+    return _INDENTS[level] if level < len(_INDENTS) else '   ' * level
+
+
 class PrintTransformer(transformer.Transformer):
     def __init__(self):
         super().__init__()
         self.level = 0
+        # Output is collected and written in one go when the traversal finishes, rather than a line at a time
+        self.lines = []
         
     def before_enter(self, args):
         super().before_enter(args)
@@ -15,21 +26,31 @@ class PrintTransformer(transformer.Transformer):
         super().after_leave(args)
         self.level -= 1
 
+    def finish(self):
+        super().finish()
+        if self.lines:
+            self.lines.append('')
+            sys.stdout.write('\n'.join(self.lines))
+            self.lines.clear()
+
+    def print_scope(self, event):
+        self.lines.append(f'{_get_indent(self.level)}{event} {self.get_scope_name()}: {self.get_qualified_scope_name()}')
+
     def enter_class(self, args):
-        print(f'{"   " * self.level}Entering class {self.get_scope_name()}: {self.get_qualified_scope_name()}')
+        self.print_scope('Entering class')
     
     def leave_class(self, args):
-        print(f'{"   " * self.level}Leaving class {self.get_scope_name()}: {self.get_qualified_scope_name()}')
+        self.print_scope('Leaving class')
         
     def enter_function(self, args):
-        print(f'{"   " * self.level}Entering function {self.get_scope_name()}: {self.get_qualified_scope_name()}')
-        print(args["code_body"])
+        self.print_scope('Entering function')
+        self.lines.append(args["code_body"])
 
     def leave_function(self, args):
-        print(f'{"   " * self.level}Leaving function {self.get_scope_name()}: {self.get_qualified_scope_name()}')
+        self.print_scope('Leaving function')
         
     def enter_other(self, args):
-        print(f'{"   " * self.level}{args["node"].type} -- {args["code_body"]}')
+        self.lines.append(f'{_get_indent(self.level)}{args["node"].type} -- {args["code_body"]}')
 
         
 def main():
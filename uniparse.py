@@ -1,5 +1,91 @@
 from tree_sitter_languages import get_language, get_parser
+import collections
+import functools
+import hashlib
 import languages
+import threading
+import transformer as transformer_module
+
+
+@functools.lru_cache(maxsize=None)
+def _get_parser(language):
+    # Creating a parser and loading its language crosses into tree-sitter, so each language is only set up once
+    parser = get_parser(language)
+    parser.set_language(get_language(language))
+    return parser
+
+
+# Parsed trees keyed by language and a digest of the source, most recently used last. Trees are never edited here,
+# so one tree can serve every transform of the same source.
+_tree_cache = collections.OrderedDict()
+_tree_cache_lock = threading.Lock()
+TREE_CACHE_SIZE = 64
+
+
+def _parse(source_code, language):
+    source_bytes = bytes(source_code, "utf8")
+    key = (language, hashlib.blake2b(source_bytes, digest_size=16).digest())
+    with _tree_cache_lock:
+        tree = _tree_cache.get(key)
+        if tree is not None:
+            _tree_cache.move_to_end(key)
+            return tree
+
+    tree = _get_parser(language).parse(source_bytes)
+    with _tree_cache_lock:
+        _tree_cache[key] = tree
+        if len(_tree_cache) > TREE_CACHE_SIZE:
+            _tree_cache.popitem(last=False)
+    return tree
+
+
+# The position of the child matched by each step of a name lookup, keyed by (parent node type, step)
+_child_index_cache = {}
+
+# The specification entry (or None) for each language's node kinds, keyed by tree-sitter's integer kind id and filled
+# in as kinds are first seen. Looking nodes up by kind id avoids creating a type string for every node.
+_specifications_by_kind_id = collections.defaultdict(dict)
+
+
+class _Arguments(dict):
+    # The arguments passed to a transformer for a node. Decoding a node's text copies it out of the tree, and most
+    # nodes' text is never read, so 'code_body' is only decoded when a transformer first looks it up.
+    __slots__ = ()
+
+    def __missing__(self, key):
+        if key != "code_body":
+            raise KeyError(key)
+        code_body = self["code_body"] = self["node"].text.decode("utf-8")
+        return code_body
+
+    def __contains__(self, key):
+        return key == "code_body" or dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        # dict.get does not fall back to __missing__, so 'code_body' is routed through indexing
+        if key == "code_body":
+            return self[key]
+        return dict.get(self, key, default)
+
+
+def _find_node_by_sequence(node, sequence):
+    # Follows the sequence of child node types down from node, returning the node it ends at or None. Each step
+    # matches the first child whose type equals the step, or satisfies it if it is callable. That child is nearly
+    # always at the same position for every parent of a type, so the position is remembered and only the children
+    # before it are checked instead of scanning them all.
+    for step in sequence:
+        matches = step if callable(step) else step.__eq__
+        children = node.children
+        key = (node.type, step)
+        index = _child_index_cache.get(key)
+        if (index is None or index >= len(children) or not matches(children[index].type)
+                or any(matches(child.type) for child in children[:index])):
+            index = next((i for i, child in enumerate(children) if matches(child.type)), None)
+            if index is None:
+                return None
+            _child_index_cache[key] = index
+        node = children[index]
+    return node
 
 
 def transform(source_code, language, transformer):
@@ -10,7 +96,11 @@ def transform(source_code, language, transformer):
     the specified language and transformer, and recursively traverses the abstract
     syntax tree (AST) to apply these actions. It ensures that the transformer is
     properly called before and after entering each node in the AST, as well as after
-    leaving it.
+    leaving it. A node's 'code_body' argument is decoded from the tree when it is
+    first looked up with args['code_body']. Leaf nodes are skipped if the transformer's 'visit_leaves' attribute is
+    False, and the contents of literals and comments are skipped if its 'visit_literals' attribute is False. The
+    transformer's 'finish' method is called once the whole tree has been
+    traversed.
 
     Parameters:
     source_code (string): The source code text to be transformed.
@@ -34,46 +124,80 @@ def transform(source_code, language, transformer):
      transform(source_code='example.py', language='python', transformer=transformer)
     """
     specification = languages.language_specifications[language]
+    specification_by_kind_id = _specifications_by_kind_id[language]
     
+    # Bound methods are called directly, without a wrapping lambda frame per node
     actions = {
-        "class": (lambda args: transformer.enter_class(args), lambda args: transformer.leave_class(args)),
-        "function": (lambda args: transformer.enter_function(args), lambda args: transformer.leave_function(args)),
-        "other": (lambda args: transformer.enter_other(args), lambda args: transformer.leave_other(args))
+        "class": (transformer.enter_class, transformer.leave_class),
+        "function": (transformer.enter_function, transformer.leave_function),
+        "other": (transformer.enter_other, transformer.leave_other)
     }
+    # The base Transformer's after_enter and before_leave do nothing, so they are only called when they are overridden
+    base = transformer_module.Transformer
+    after_enter = None if type(transformer).after_enter is base.after_enter else transformer.after_enter
+    before_leave = None if type(transformer).before_leave is base.before_leave else transformer.before_leave
+    # The (enter action, leave action, name lookup sequence) for each node kind, so that a node's actions are found
+    # with a single lookup once its kind has been seen
+    dispatch = {}
     
-    def find_node_by_sequence(node, sequence):
-        comparator = sequence[0] if callable(sequence[0]) else lambda nt: nt == sequence[0]
-        next_node = next((child for child in node.children if comparator(child.type)), None)
-        return next_node if len(sequence) == 1 else find_node_by_sequence(next_node, sequence[1:]) if next_node else None
-
-    def traverse(node):
-        node_type = specification.get(node.type)
-        enter_action, leave_action = actions[node_type[0]] if (node_type and node_type[0] in actions) else actions['other']        
-        code_body = node.text.decode("utf-8")
+    def enter(node):
+        # Runs the enter actions for a node and returns what its leave actions need
+        kind_id = node.kind_id
+        try:
+            enter_action, leave_action, sequence = dispatch[kind_id]
+        except KeyError:
+            try:
+                node_type = specification_by_kind_id[kind_id]
+            except KeyError:
+                node_type = specification_by_kind_id[kind_id] = specification.get(node.type)
+            enter_action, leave_action = actions[node_type[0]] if (node_type and node_type[0] in actions) else actions['other']
+            sequence = node_type[1] if node_type else None
+            dispatch[kind_id] = enter_action, leave_action, sequence
         name = None
             
-        if node_type:
-            subtype = node_type[1]
-            name_node = find_node_by_sequence(node, subtype)
+        if sequence is not None:
+            name_node = _find_node_by_sequence(node, sequence)
             if name_node:
-                name = name_node.text.decode("utf-8") if isinstance(name_node.text, bytes) else name_node.text
+                name = name_node.text.decode("utf-8")
                 
-        arguments = {
-            "code_body": code_body,
-            "name": name,
-            "node": node
-        }
+        arguments = _Arguments(name=name, node=node)
                 
         transformer.before_enter(arguments)
         enter_action(arguments)                
-        transformer.after_enter(arguments)
-        for child in node.children:
-            traverse(child)
-        transformer.before_leave(arguments)
+        if after_enter is not None:
+            after_enter(arguments)
+        return leave_action, arguments
+
+    def leave(leave_action, arguments):
+        if before_leave is not None:
+            before_leave(arguments)
         leave_action(arguments)
         transformer.after_leave(arguments)
 
-    parser = get_parser(language)
-    parser.set_language(get_language(language))
-    tree = parser.parse(bytes(source_code, "utf8"))
-    traverse(tree.root_node) 
+    tree = _parse(source_code, language)
+
+    # The tree is walked with a tree-sitter cursor, which moves between nodes without building a list of children
+    # for every node. The (leave action, arguments) of each entered node are kept on an explicit stack rather than by
+    # recursion, so deeply nested code cannot exceed the recursion limit.
+    visit_leaves = transformer.visit_leaves
+    skipped_kinds = frozenset() if transformer.visit_literals else languages.literal_kinds[language]
+    cursor = tree.walk()
+    stack = [enter(cursor.node)]
+    descending = cursor.goto_first_child()
+    while stack:
+        if descending:
+            node = cursor.node
+            if visit_leaves or node.child_count:
+                stack.append(enter(node))
+                if (not skipped_kinds or node.type not in skipped_kinds) and cursor.goto_first_child():
+                    continue
+                leave(*stack.pop())
+        # The node under the cursor is finished, so move on to its next sibling, or else finish its parent
+        if cursor.goto_next_sibling():
+            descending = True
+        else:
+            cursor.goto_parent()
+            leave(*stack.pop())
+            descending = False
+    transformer.finish()
+